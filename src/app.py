@@ -1,8 +1,13 @@
 import os
-from flask import Flask, render_template, request, redirect, url_for, flash
+import math
+from functools import wraps
+from flask import (Flask, render_template, request, redirect, url_for, flash,
+                   jsonify)
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from models import Base, Warehouse, Item
+from transfer import transfer_items, TransferError
+from ratelimit import RateLimiter, AdmissionQueue
 
 app = Flask(__name__)
 
@@ -50,6 +55,87 @@ def reset_db():
     _Session = None
 
 
+def _environ_number(name, default, kind):
+    value = os.environ.get(name, default).strip()
+    if not value:
+        return kind(0)
+    try:
+        return kind(value)
+    except ValueError:
+        raise RuntimeError(f"{name} must be a number, got {value!r}") from None
+
+
+def _create_limits():
+    """Create the write limits from environment variables.
+
+    WRITE_RATE_LIMIT is the average number of writes per second allowed
+    for each client and route, and WRITE_RATE_BURST the size of a burst.
+    WRITE_CONCURRENCY caps the writes running at once, with at most
+    WRITE_QUEUE_SIZE more waiting up to WRITE_QUEUE_TIMEOUT seconds.
+    Setting WRITE_RATE_LIMIT or WRITE_CONCURRENCY to 0 or empty disables
+    rate limiting or admission control. Invalid values raise RuntimeError
+    at startup.
+    """
+    rate = _environ_number('WRITE_RATE_LIMIT', '10', float)
+    concurrency = _environ_number('WRITE_CONCURRENCY', '4', int)
+    try:
+        rate_limiter = RateLimiter(
+            rate, _environ_number('WRITE_RATE_BURST', '20', int)
+        ) if rate else None
+        admission = AdmissionQueue(
+            concurrency, _environ_number('WRITE_QUEUE_SIZE', '16', int),
+            _environ_number('WRITE_QUEUE_TIMEOUT', '2', float)
+        ) if concurrency else None
+    except ValueError as error:
+        raise RuntimeError(f"Invalid write limit settings: {error}") from None
+    return rate_limiter, admission
+
+
+# Write limits - None when disabled
+_rate_limiter, _admission = _create_limits()
+
+
+def reset_limits():
+    """Re-read write limits from the environment and reset their counters
+    (useful for testing)."""
+    global _rate_limiter, _admission
+    _rate_limiter, _admission = _create_limits()
+
+
+def _too_many_requests(retry_after):
+    return ('Too many requests, please try again later', 429,
+            {'Retry-After': str(max(1, math.ceil(retry_after)))})
+
+
+def _rate_limit_wait():
+    if _rate_limiter is None:
+        return 0.0
+    return _rate_limiter.check((request.remote_addr, request.endpoint))
+
+
+def limit_writes(view):
+    """Rate limit and admission control POST requests to a route."""
+    @wraps(view)
+    def limited_view(*args, **kwargs):
+        if request.method != 'POST':
+            return view(*args, **kwargs)
+
+        wait = _rate_limit_wait()
+        if wait:
+            return _too_many_requests(wait)
+
+        admission = _admission
+        if admission is None:
+            return view(*args, **kwargs)
+        if not admission.acquire():
+            return _too_many_requests(admission.retry_after())
+        try:
+            return view(*args, **kwargs)
+        finally:
+            admission.release()
+    return limited_view
+
+
 @app.route('/')
 def index():
     """List all warehouses."""
@@ -62,6 +148,7 @@ def index():
 
 
 @app.route('/warehouse/new', methods=['GET', 'POST'])
+@limit_writes
 def create_warehouse():
     """Create a new warehouse."""
     if request.method == 'POST':
@@ -105,6 +192,7 @@ def view_warehouse(warehouse_id):
 
 
 @app.route('/warehouse/<int:warehouse_id>/edit', methods=['GET', 'POST'])
+@limit_writes
 def edit_warehouse(warehouse_id):
     """Edit a warehouse."""
     session = get_db_session()
@@ -139,6 +227,7 @@ def edit_warehouse(warehouse_id):
 
 
 @app.route('/warehouse/<int:warehouse_id>/delete', methods=['POST'])
+@limit_writes
 def delete_warehouse(warehouse_id):
     """Delete a warehouse."""
     session = get_db_session()
@@ -158,6 +247,7 @@ def delete_warehouse(warehouse_id):
 
 
 @app.route('/warehouse/<int:warehouse_id>/item/add', methods=['GET', 'POST'])
+@limit_writes
 def add_item(warehouse_id):
     """Add an item to a warehouse."""
     session = get_db_session()
@@ -192,6 +282,7 @@ def add_item(warehouse_id):
 
 
 @app.route('/warehouse/<int:warehouse_id>/item/<int:item_id>/edit', methods=['GET', 'POST'])
+@limit_writes
 def edit_item(warehouse_id, item_id):
     """Edit an item in a warehouse."""
     session = get_db_session()
@@ -231,6 +322,7 @@ def edit_item(warehouse_id, item_id):
 
 
 @app.route('/warehouse/<int:warehouse_id>/item/<int:item_id>/delete', methods=['POST'])
+@limit_writes
 def delete_item(warehouse_id, item_id):
     """Delete an item from a warehouse."""
     session = get_db_session()
@@ -249,6 +341,64 @@ def delete_item(warehouse_id, item_id):
         session.close()
 
 
+def _transfer_form_moves(warehouse):
+    """Build transfer moves from the submitted transfer form."""
+    destination_id = request.form.get('destination_id', type=int)
+    if destination_id is None:
+        raise TransferError('Destination warehouse is required')
+    moves = []
+    for item in warehouse.items:
+        quantity = request.form.get(f'quantity_{item.id}', 0.0, type=float)
+        if quantity > 0:
+            moves.append((item.id, destination_id, quantity))
+    return moves
+
+
+def _render_transfer_form(session, warehouse):
+    destinations = (session.query(Warehouse)
+                    .filter(Warehouse.id != warehouse.id).all())
+    return render_template('transfer_form.html', warehouse=warehouse,
+                           destinations=destinations)
+
+
+def _handle_transfer(session, warehouse):
+    """Run a submitted transfer, or show the form again with the error."""
+    try:
+        transfer_items(session, _transfer_form_moves(warehouse))
+    except TransferError as error:
+        flash(str(error), 'error')
+        return _render_transfer_form(session, warehouse)
+    flash('Items transferred successfully', 'success')
+    return redirect(url_for('view_warehouse', warehouse_id=warehouse.id))
+
+
+@app.route('/warehouse/<int:warehouse_id>/transfer',
+           methods=['GET', 'POST'])
+@limit_writes
+def transfer_stock(warehouse_id):
+    """Transfer items from a warehouse to another warehouse."""
+    session = get_db_session()
+    try:
+        warehouse = session.query(Warehouse).filter_by(
+            id=warehouse_id).first()
+        if not warehouse:
+            flash('Warehouse not found', 'error')
+            return redirect(url_for('index'))
+
+        if request.method == 'POST':
+            return _handle_transfer(session, warehouse)
+        return _render_transfer_form(session, warehouse)
+    finally:
+        session.close()
+
+
+@app.route('/limits')
+def limits():
+    """Show write limit counters, null for disabled limits."""
+    return jsonify(rate_limit=_rate_limiter and _rate_limiter.stats(),
+                   admission=_admission and _admission.stats())
+
+
 if __name__ == '__main__':
     # Only enable debug mode if explicitly set via environment variable
     debug_mode = os.environ.get('FLASK_DEBUG', 'false').lower() == 'true'
@@ -0,0 +1,117 @@
+# Rate limiting and admission control for write requests
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+class RateLimiter:
+    """A token bucket for each key, e.g. a (client, route) pair.
+
+    Each key may make rate requests per second on average and bursts of
+    up to burst requests. At most max_buckets keys are tracked; the least
+    recently seen key is forgotten first.
+    """
+
+    def __init__(self, rate, burst, max_buckets=10000, clock=time.monotonic):
+        if not (rate > 0 and burst >= 1 and max_buckets >= 1):
+            raise ValueError("rate must be positive and burst and max_buckets "
+                             "at least 1")
+        self.rate = rate
+        self.burst = burst
+        self.max_buckets = max_buckets
+        self._clock = clock
+        # key -> [tokens, time of last refill], least recently used first
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self._counts = {'allowed': 0, 'limited': 0}
+
+    def _bucket(self, key, now):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_buckets:
+                self._buckets.popitem(last=False)
+            bucket = self._buckets[key] = [float(self.burst), now]
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def _take(self, bucket, now):
+        elapsed = max(now - bucket[1], 0.0)
+        bucket[0] = min(self.burst, bucket[0] + elapsed * self.rate)
+        bucket[1] = now
+        if bucket[0] >= 1.0:
+            bucket[0] -= 1.0
+            return 0.0
+        return (1.0 - bucket[0]) / self.rate
+
+    def check(self, key):
+        """Returns 0.0 if the request may proceed, otherwise the number of
+        seconds the client should wait before retrying."""
+        with self._lock:
+            now = self._clock()
+            wait = self._take(self._bucket(key, now), now)
+            self._counts['limited' if wait else 'allowed'] += 1
+            return wait
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts, clients=len(self._buckets))
+
+
+class AdmissionQueue:
+    """Lets at most max_concurrent requests run at once.
+
+    Up to max_waiting further requests wait at most timeout seconds for a
+    slot; anything beyond that is rejected straight away.
+    """
+
+    def __init__(self, max_concurrent, max_waiting, timeout):
+        if max_concurrent < 1 or max_waiting < 0:
+            raise ValueError("max_concurrent must be at least 1 and "
+                             "max_waiting non-negative")
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(('running', 'waiting', 'admitted',
+                                      'rejected', 'timed_out'), 0)
+
+    def _wait(self):
+        with self._lock:
+            if self._counts['waiting'] >= self.max_waiting:
+                self._counts['rejected'] += 1
+                return False
+            self._counts['waiting'] += 1
+        # released in release(), after the request has run
+        acquired = self._slots.acquire(  # pylint: disable=consider-using-with
+            timeout=self.timeout)
+        with self._lock:
+            self._counts['waiting'] -= 1
+            if not acquired:
+                self._counts['timed_out'] += 1
+        return acquired
+
+    def acquire(self):
+        """Returns True if the request was admitted. It must then call
+        release() when done."""
+        # released in release(), after the request has run
+        if not self._slots.acquire(  # pylint: disable=consider-using-with
+                blocking=False) and not self._wait():
+            return False
+        with self._lock:
+            self._counts['running'] += 1
+            self._counts['admitted'] += 1
+        return True
+
+    def release(self):
+        with self._lock:
+            self._counts['running'] -= 1
+        self._slots.release()
+
+    def retry_after(self):
+        return max(1, math.ceil(self.timeout))
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts)
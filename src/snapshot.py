@@ -0,0 +1,232 @@
+# Columnar binary snapshots of the warehouse database
+import mmap
+import os
+import struct
+import sys
+from array import array
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+from models import Warehouse, Item
+from varasto import Varasto
+
+# File layout (little-endian, every section 8-byte aligned):
+#   header        magic, version, warehouse count, item count
+#   warehouses    ids (int64), capacities (float64), name offsets (int64)
+#   items         ids (int64), warehouse ids (int64), quantities (float64),
+#                 name offsets (int64)
+#   string table  UTF-8 names; warehouse names first, then item names
+# Name offsets have count + 1 entries so that name i is
+# table[offsets[i]:offsets[i + 1]].
+MAGIC = b'VRST'
+VERSION = 1
+_HEADER = struct.Struct('<4sIQQ')
+_FETCH_SIZE = 10000
+
+# column names and array type codes of each table, id first
+WAREHOUSE_COLUMNS = (('id', 'q'), ('capacity', 'd'))
+ITEM_COLUMNS = (('id', 'q'), ('warehouse_id', 'q'), ('quantity', 'd'))
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _check_byteorder():
+    # array and memoryview.cast use the native byte order
+    if sys.byteorder != 'little':
+        raise SnapshotError("Snapshots require a little-endian host")
+
+
+def _read_table(session, model, columns, base=0):
+    """Stream the rows of model into typed arrays without building ORM
+    objects. Returns the columns, followed by the name offsets starting
+    from base, and the encoded names."""
+    arrays = [array(code) for _, code in columns]
+    offsets = array('q', [base])
+    names = []
+    stmt = select(*(getattr(model, name) for name, _ in columns), model.name)
+    for row in session.execute(stmt.order_by(model.id),
+                               execution_options={'yield_per': _FETCH_SIZE}):
+        for column, value in zip(arrays, row):
+            column.append(value or 0)
+        names.append(row[-1].encode('utf-8'))
+        offsets.append(offsets[-1] + len(names[-1]))
+    return arrays + [offsets], b''.join(names)
+
+
+def _check_orphans(warehouse_ids, item_warehouse_ids):
+    # SQLite does not enforce the foreign key from items to warehouses
+    orphans = set(item_warehouse_ids).difference(warehouse_ids)
+    if orphans:
+        raise SnapshotError(f"Item refers to missing warehouse {min(orphans)}")
+
+
+def export_snapshot(session, path):
+    """Write all warehouses and items to path. Returns the row counts.
+
+    Raises SnapshotError, without writing anything, if an item refers to
+    a warehouse that does not exist.
+    """
+    _check_byteorder()
+    warehouses, warehouse_names = _read_table(session, Warehouse,
+                                              WAREHOUSE_COLUMNS)
+    # item names follow the warehouse names in the shared string table
+    items, item_names = _read_table(session, Item, ITEM_COLUMNS,
+                                    base=len(warehouse_names))
+    _check_orphans(warehouses[0], items[1])
+
+    with open(path, 'wb') as snapshot_file:
+        snapshot_file.write(_HEADER.pack(MAGIC, VERSION,
+                                         len(warehouses[0]), len(items[0])))
+        for column in warehouses + items:
+            column.tofile(snapshot_file)
+        snapshot_file.write(warehouse_names + item_names)
+    return len(warehouses[0]), len(items[0])
+
+
+class SnapshotTable:
+    """The columns of one table, e.g. table['quantity'], as memoryviews
+    into the mapped file."""
+
+    def __init__(self, columns, offsets, strings):
+        self._columns = columns
+        self._offsets = offsets
+        self._strings = strings
+
+    def __getitem__(self, column):
+        return self._columns[column]
+
+    def __len__(self):
+        return len(self._columns['id'])
+
+    def name(self, index):
+        start, end = self._offsets[index], self._offsets[index + 1]
+        try:
+            return bytes(self._strings[start:end]).decode('utf-8')
+        except UnicodeDecodeError as error:
+            raise SnapshotError(f"Invalid name in row {index}") from error
+
+
+class _Reader:
+    """Maps consecutive sections of a snapshot and keeps track of the
+    views it hands out, so that they can all be released."""
+
+    def __init__(self, view):
+        self.view = view
+        self.position = _HEADER.size
+        self.views = []
+
+    def _take(self, end, code='B'):
+        if end > len(self.view):
+            raise ValueError("snapshot file is truncated")
+        section = self.view[self.position:end]
+        self.views.append(section.cast(code))
+        section.release()
+        self.position = end
+        return self.views[-1]
+
+    def _columns(self, columns, count):
+        views = {name: self._take(self.position + 8 * count, code)
+                 for name, code in columns}
+        return views, self._take(self.position + 8 * (count + 1), 'q')
+
+    def tables(self):
+        magic, version, warehouses, items = _HEADER.unpack_from(self.view)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("unknown snapshot format")
+        warehouse_columns = self._columns(WAREHOUSE_COLUMNS, warehouses)
+        item_columns = self._columns(ITEM_COLUMNS, items)
+        strings = self._take(len(self.view))
+        return (SnapshotTable(*warehouse_columns, strings),
+                SnapshotTable(*item_columns, strings))
+
+    def release(self):
+        while self.views:
+            self.views.pop().release()
+
+
+def _map_file(path):
+    with open(path, 'rb') as snapshot_file:
+        # mmap cannot map an empty file, so check the size first
+        if os.fstat(snapshot_file.fileno()).st_size < _HEADER.size:
+            raise SnapshotError(f"Invalid snapshot file: {path}")
+        return mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class Snapshot:
+    """A memory-mapped snapshot.
+
+    warehouses and items are SnapshotTables whose columns are views into
+    the mapped file, so loading copies nothing. Call close() (or use a
+    with block) when done.
+    """
+
+    def __init__(self, path):
+        _check_byteorder()
+        self._mmap = _map_file(path)
+        self._view = memoryview(self._mmap)
+        self._reader = _Reader(self._view)
+        try:
+            self.warehouses, self.items = self._reader.tables()
+        except (struct.error, TypeError, ValueError) as error:
+            self.close()
+            raise SnapshotError(f"Invalid snapshot file: {path}") from error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Release the columns and unmap the file.
+
+        Slices taken from the columns keep the mapping alive and must be
+        released first. Otherwise SnapshotError is raised, and close()
+        can be called again once they have been released.
+        """
+        self._reader.release()
+        self._view.release()
+        try:
+            self._mmap.close()
+        except BufferError as error:
+            raise SnapshotError("Release slices of the snapshot columns "
+                                "before closing it") from error
+
+    def varastot(self):
+        """Build a Varasto for each warehouse, keyed by warehouse id.
+
+        The saldo of a warehouse is the total quantity of its items.
+        """
+        saldot = dict.fromkeys(self.warehouses['id'], 0.0)
+        for warehouse_id, quantity in zip(self.items['warehouse_id'],
+                                          self.items['quantity']):
+            if warehouse_id not in saldot:
+                raise SnapshotError(f"Item refers to missing warehouse "
+                                    f"{warehouse_id}")
+            saldot[warehouse_id] += quantity
+        return {warehouse_id: Varasto(capacity, saldot[warehouse_id])
+                for warehouse_id, capacity
+                in zip(self.warehouses['id'], self.warehouses['capacity'])}
+
+
+def load_snapshot(path):
+    """Memory-map a snapshot written by export_snapshot()."""
+    return Snapshot(path)
+
+
+def main(argv):
+    if len(argv) != 3:
+        print(f"usage: {argv[0]} DATABASE_URL OUTPUT_FILE")
+        return 1
+    session = sessionmaker(bind=create_engine(argv[1]))()
+    try:
+        warehouses, items = export_snapshot(session, argv[2])
+    finally:
+        session.close()
+    print(f"Wrote {warehouses} warehouses and {items} items to {argv[2]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,409 @@
+# Randomised concurrent consistency checks for Varasto and the database
+import argparse
+import importlib
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from sqlalchemy import func
+from app import app, get_db_session, get_engine, reset_db, reset_limits
+from models import Warehouse, Item
+from transfer import transfer_items, TransferError
+from varasto import Varasto
+
+# allowed floating point drift when comparing balances
+TOLERANCE = 1e-6
+
+
+class StressResult:
+    def __init__(self, name, operations, seconds, violations, rejected=0):
+        self.name = name
+        self.operations = operations
+        self.seconds = seconds
+        self.violations = violations
+        self.rejected = rejected
+
+    @property
+    def throughput(self):
+        return self.operations / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        status = (f'{len(self.violations)} violations' if self.violations
+                  else 'OK')
+        return (f"{self.name}: {self.operations} operations in "
+                f"{self.seconds:.3f} s ({self.throughput:.0f} ops/s), "
+                f"{self.rejected} rejected, {status}")
+
+
+class ReferenceVarasto:
+    """The Varasto rules written as plainly as possible."""
+
+    def __init__(self, tilavuus, saldo):
+        self.tilavuus = tilavuus
+        self.saldo = saldo
+
+    def lisaa(self, maara):
+        lisatty = min(max(maara, 0.0), self.tilavuus - self.saldo)
+        self.saldo += lisatty
+        return lisatty
+
+    def ota(self, maara):
+        otettu = min(max(maara, 0.0), self.saldo)
+        self.saldo -= otettu
+        return otettu
+
+
+def _random_operations(rng, count, capacity):
+    # mostly sensible amounts, with some negative and oversized ones
+    return [(rng.choice(('lisaa', 'ota')),
+             rng.uniform(-0.1 * capacity, 0.6 * capacity))
+            for _ in range(count)]
+
+
+def _close(a, b):
+    return abs(a - b) <= TOLERANCE * max(1.0, abs(a), abs(b))
+
+
+def _check_varasto_log(index, varasto, alku_saldo, log):
+    """Replay a log in execution order against the reference rules."""
+    violations = []
+    reference = ReferenceVarasto(varasto.tilavuus, alku_saldo)
+    for operation, maara, muutos, saldo in log:
+        odotettu = getattr(reference, operation)(maara)
+        if not _close(muutos, odotettu) or not _close(saldo, reference.saldo):
+            violations.append(f"varasto {index}: {operation}({maara}) "
+                              f"changed saldo by {muutos}, expected "
+                              f"{odotettu}")
+        if not -TOLERANCE <= saldo <= varasto.tilavuus + TOLERANCE:
+            violations.append(f"varasto {index}: saldo {saldo} outside "
+                              f"[0, {varasto.tilavuus}]")
+    return violations
+
+
+def _check_conserved(index, varasto, alku_saldo, log):
+    lisatty = sum(m for op, _, m, _ in log if op == 'lisaa')
+    otettu = sum(m for op, _, m, _ in log if op == 'ota')
+    if _close(varasto.saldo, alku_saldo + lisatty - otettu):
+        return []
+    return [f"varasto {index}: saldo {varasto.saldo} is not conserved"]
+
+
+def _apply(varasto, operation, maara):
+    """Run an operation and return how much the saldo changed by."""
+    if operation == 'ota':
+        return varasto.ota_varastosta(maara)
+    ennen = varasto.saldo
+    varasto.lisaa_varastoon(maara)
+    return varasto.saldo - ennen
+
+
+def _varasto_worker(rng, varastot, locks, logs, count):
+    for operation, maara in _random_operations(rng, count, 100.0):
+        index = rng.randrange(len(varastot))
+        with locks[index]:
+            muutos = _apply(varastot[index], operation, maara)
+            logs[index].append((operation, maara, muutos,
+                                varastot[index].saldo))
+
+
+def _run_threads(targets):
+    """Run each (function, args) in its own thread. Returns the seconds
+    it took for all of them to finish."""
+    threads = [threading.Thread(target=target, args=args)
+               for target, args in targets]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def stress_varasto(operations=100000, threads=8, varastot=16, seed=0,
+                   varasto_class=Varasto):
+    """Run random operations on shared varasto_class objects from many
+    threads and check them against the reference rules.
+
+    Varasto is not thread safe, so each one is guarded by a lock; the
+    per varasto logs record the order the operations actually ran in.
+    """
+    rng = random.Random(seed)
+    kohteet = [varasto_class(rng.uniform(1.0, 200.0), rng.uniform(0.0, 100.0))
+               for _ in range(varastot)]
+    alku_saldot = [varasto.saldo for varasto in kohteet]
+    locks = [threading.Lock() for _ in kohteet]
+    logs = [[] for _ in kohteet]
+    seconds = _run_threads([(_varasto_worker,
+                             (random.Random(rng.random()), kohteet, locks,
+                              logs, operations // threads))
+                            for _ in range(threads)])
+
+    violations = []
+    for index, varasto in enumerate(kohteet):
+        violations.extend(_check_varasto_log(index, varasto,
+                                             alku_saldot[index], logs[index]))
+        violations.extend(_check_conserved(index, varasto,
+                                           alku_saldot[index], logs[index]))
+    return StressResult('Varasto', sum(map(len, logs)), seconds, violations)
+
+
+class StressConfig:
+    """The size of a database stress run; pass keyword arguments to
+    override the defaults."""
+
+    operations = 2000
+    threads = 4
+    warehouses = 4
+    items = 32
+    seed = 0
+
+    def __init__(self, **settings):
+        for name, value in settings.items():
+            if not hasattr(StressConfig, name):
+                raise TypeError(f"Unknown stress setting {name!r}")
+            setattr(self, name, value)
+
+    def per_thread(self):
+        return self.operations // self.threads
+
+    def item_stock(self):
+        # transfer amounts are in proportion to the stock of one item
+        return 100.0 * self.warehouses / self.items
+
+
+class _TransferWorker:
+    """Transfers random amounts of stock between random warehouses.
+
+    A refused transfer (TransferError) counts as rejected; any other
+    failure, such as the database being locked, is a violation.
+    """
+
+    def __init__(self, rng, items, warehouse_ids):
+        self.rng = rng
+        self.items = items
+        self.warehouse_ids = warehouse_ids
+        self.operations = 0
+        self.rejected = 0
+        self.violations = []
+
+    def pick(self):
+        """A random item, its warehouse and another warehouse."""
+        item_id, source_id = self.rng.choice(self.items)
+        return item_id, source_id, self.rng.choice(
+            [warehouse_id for warehouse_id in self.warehouse_ids
+             if warehouse_id != source_id])
+
+    def attempt(self, transfer, maara):
+        try:
+            transfer(*self.pick(), maara)
+        except TransferError:
+            self.rejected += 1
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            self.violations.append(f"transfer failed: {error!r}")
+        else:
+            self.operations += 1
+
+    def run(self, transfers, config):
+        with transfers() as transfer:
+            for _, maara in _random_operations(self.rng, config.per_thread(),
+                                               config.item_stock()):
+                self.attempt(transfer, maara)
+
+
+@contextmanager
+def _route_transfers():
+    """Transfers by posting the transfer form of the web app."""
+    client = app.test_client()
+
+    def transfer(item_id, source_id, destination_id, maara):
+        response = client.post(f'/warehouse/{source_id}/transfer',
+                               data={'destination_id': destination_id,
+                                     f'quantity_{item_id}': maara})
+        # 200 is the form shown again with an error, 429 an overloaded
+        # server; anything but those and a redirect is a failure
+        if response.status_code in (200, 429):
+            raise TransferError(f"refused with {response.status_code}")
+        if response.status_code != 302:
+            raise RuntimeError(f"transfer route answered "
+                               f"{response.status_code}")
+
+    yield transfer
+
+
+@contextmanager
+def _api_transfers():
+    """Transfers by calling transfer_items() the way the route does."""
+    session = get_db_session()
+
+    def transfer(item_id, source_id, destination_id, maara):
+        # the route loads the source items before transferring
+        source = session.query(Warehouse).filter_by(id=source_id).one()
+        len(source.items)
+        transfer_items(session, [(item_id, destination_id, maara)])
+
+    try:
+        yield transfer
+    finally:
+        session.close()
+
+
+def _check_totals(session):
+    violations = []
+    negative = session.query(Item).filter(Item.quantity < -TOLERANCE).count()
+    if negative:
+        violations.append(f"{negative} items have a negative quantity")
+    totals = (session.query(Warehouse.id, Warehouse.capacity,
+                            func.sum(Item.quantity))
+              .join(Item).group_by(Warehouse.id).all())
+    violations.extend(f"warehouse {warehouse_id} holds {total}, "
+                      f"capacity {capacity}"
+                      for warehouse_id, capacity, total in totals
+                      if total > capacity + TOLERANCE)
+    return violations
+
+
+def _check_database(session, initial_total):
+    violations = _check_totals(session)
+    total = session.query(func.sum(Item.quantity)).scalar()
+    if not _close(total, initial_total):
+        violations.append(f"total quantity {total} is not conserved, "
+                          f"expected {initial_total}")
+    return violations
+
+
+def _populate(session, rng, config):
+    rows = [Warehouse(name=f'Varasto {i}', capacity=100.0)
+            for i in range(config.warehouses)]
+    session.add_all(rows)
+    session.commit()
+    # every name is in every warehouse, so transfers merge into known items
+    session.add_all(Item(name=f'Tuote {i // config.warehouses}',
+                         quantity=rng.uniform(0.0, config.item_stock()),
+                         warehouse_id=rows[i % config.warehouses].id)
+                    for i in range(config.items))
+    session.commit()
+    return (session.query(Item.id, Item.warehouse_id).all(),
+            [row.id for row in rows])
+
+
+# the app's settings during a run: no write rate limit
+_APP_ENVIRON = {'WRITE_RATE_LIMIT': '0'}
+
+
+def _set_environ(settings):
+    """Apply settings to the environment and reload the app's database and
+    write limits from it. A None value unsets the variable."""
+    for key, value in settings.items():
+        if value is None:
+            os.environ.pop(key, None)
+        else:
+            os.environ[key] = value
+    reset_db()
+    reset_limits()
+
+
+@contextmanager
+def _app_database(db_url):
+    """Point the web app at db_url, without the write rate limit."""
+    saved = {key: os.environ.get(key)
+             for key in ('DATABASE_URL', *_APP_ENVIRON)}
+    _set_environ(dict(_APP_ENVIRON, DATABASE_URL=db_url))
+    try:
+        yield
+    finally:
+        get_engine().dispose()
+        _set_environ(saved)
+
+
+_PATHS = {'route': ('transfer route', _route_transfers),
+          'api': ('transfer_items()', _api_transfers)}
+
+
+def _run_workers(transfers, session, config):
+    """Populate the database and run the workers against it. Returns the
+    workers, the seconds they took and the violations found."""
+    rng = random.Random(config.seed)
+    item_rows, warehouse_ids = _populate(session, rng, config)
+    initial_total = session.query(func.sum(Item.quantity)).scalar()
+    workers = [_TransferWorker(random.Random(rng.random()), item_rows,
+                               warehouse_ids)
+               for _ in range(config.threads)]
+    seconds = _run_threads([(worker.run, (transfers, config))
+                            for worker in workers])
+    violations = _check_database(session, initial_total)
+    violations.extend(violation for worker in workers
+                      for violation in worker.violations)
+    return workers, seconds, violations
+
+
+def stress_database(db_url, path='route', config=None):
+    """Run random concurrent transfers through the app's own code.
+
+    path 'route' posts the transfer form from a test client per thread,
+    'api' calls transfer_items() from a session per thread. Transfers
+    take and add stock by the Varasto rules; refused ones count as
+    rejected and must leave no trace.
+    """
+    name, transfers = _PATHS[path]
+    with _app_database(db_url):
+        session = get_db_session()
+        try:
+            workers, seconds, violations = _run_workers(
+                transfers, session, config or StressConfig())
+        finally:
+            session.close()
+    return StressResult(name, sum(w.operations for w in workers), seconds,
+                        violations, sum(w.rejected for w in workers))
+
+
+def _load_class(spec):
+    module_name, _, class_name = spec.partition(':')
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Check Varasto and database balances under load.')
+    parser.add_argument('--operations', type=int, default=100000)
+    parser.add_argument('--db-operations', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--varasto', type=_load_class, default=Varasto,
+                        metavar='MODULE:CLASS',
+                        help='Varasto implementation to check')
+    return parser.parse_args(argv)
+
+
+def _stress_database_paths(config):
+    results = []
+    for path in _PATHS:
+        fd, db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        try:
+            results.append(stress_database(f'sqlite:///{db_path}', path,
+                                           config))
+        finally:
+            os.unlink(db_path)
+    return results
+
+
+def main(argv):
+    args = _parse_args(argv)
+    results = [stress_varasto(args.operations, args.threads, seed=args.seed,
+                              varasto_class=args.varasto)]
+    results.extend(_stress_database_paths(StressConfig(
+        operations=args.db_operations, threads=args.threads,
+        seed=args.seed)))
+
+    for result in results:
+        print(result)
+        for violation in result.violations[:10]:
+            print(f"  {violation}")
+    return 1 if any(result.violations for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,7 +1,7 @@
 import unittest
 import os
 import tempfile
-from app import app, get_db_session, reset_db
+from app import app, get_db_session, reset_db, reset_limits
 from models import Base, Warehouse, Item
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
@@ -34,6 +34,7 @@ class TestWarehouseApp(unittest.TestCase):
     def setUp(self):
         self.app = app.test_client()
         self.app.testing = True
+        reset_limits()
         # Clear all data before each test
         session = self.Session()
         session.query(Item).delete()
@@ -207,6 +208,120 @@ class TestWarehouseApp(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn(b'deleted successfully', response.data)
 
+    def test_transfer_items(self):
+        """Test transferring items between warehouses."""
+        session = self.Session()
+        source = Warehouse(name='Transfer Source', capacity=100.0)
+        destination = Warehouse(name='Transfer Destination', capacity=100.0)
+        session.add_all([source, destination])
+        session.commit()
+        item = Item(name='Transfer Item', quantity=10.0, warehouse_id=source.id)
+        session.add(item)
+        session.commit()
+        source_id = source.id
+        destination_id = destination.id
+        item_id = item.id
+        session.close()
+
+        response = self.app.post(f'/warehouse/{source_id}/transfer', data={
+            'destination_id': str(destination_id),
+            f'quantity_{item_id}': '4'
+        }, follow_redirects=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'transferred successfully', response.data)
+
+        session = self.Session()
+        moved = session.query(Item).filter_by(warehouse_id=destination_id).one()
+        self.assertEqual(moved.quantity, 4.0)
+        self.assertEqual(session.get(Item, item_id).quantity, 6.0)
+        session.close()
+
+    def test_transfer_over_capacity(self):
+        """Test that a transfer exceeding destination capacity is rejected."""
+        session = self.Session()
+        source = Warehouse(name='Full Source', capacity=100.0)
+        destination = Warehouse(name='Small Destination', capacity=2.0)
+        session.add_all([source, destination])
+        session.commit()
+        item = Item(name='Big Item', quantity=10.0, warehouse_id=source.id)
+        session.add(item)
+        session.commit()
+        source_id = source.id
+        destination_id = destination.id
+        item_id = item.id
+        session.close()
+
+        response = self.app.post(f'/warehouse/{source_id}/transfer', data={
+            'destination_id': str(destination_id),
+            f'quantity_{item_id}': '4'
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Not enough space', response.data)
+
+        session = self.Session()
+        self.assertEqual(session.get(Item, item_id).quantity, 10.0)
+        session.close()
+
+    def test_write_rate_limited(self):
+        """Test that bursts of writes are rejected with 429."""
+        os.environ['WRITE_RATE_LIMIT'] = '0.1'
+        os.environ['WRITE_RATE_BURST'] = '2'
+        reset_limits()
+        try:
+            for _ in range(2):
+                response = self.app.post('/warehouse/new', data={
+                    'name': 'Burst', 'capacity': '1'})
+                self.assertEqual(response.status_code, 302)
+
+            response = self.app.post('/warehouse/new', data={
+                'name': 'Burst', 'capacity': '1'})
+            self.assertEqual(response.status_code, 429)
+            self.assertIn('Retry-After', response.headers)
+
+            # reads are not limited
+            response = self.app.get('/warehouse/new')
+            self.assertEqual(response.status_code, 200)
+
+            response = self.app.get('/limits')
+            self.assertEqual(response.json['rate_limit']['allowed'], 2)
+            self.assertEqual(response.json['rate_limit']['limited'], 1)
+        finally:
+            del os.environ['WRITE_RATE_LIMIT']
+            del os.environ['WRITE_RATE_BURST']
+            reset_limits()
+
+    def test_invalid_write_limits(self):
+        """Test that invalid write limit settings fail when read."""
+        for name, value in [('WRITE_RATE_LIMIT', 'fast'),
+                            ('WRITE_RATE_LIMIT', '-1'),
+                            ('WRITE_CONCURRENCY', '-1')]:
+            os.environ[name] = value
+            try:
+                with self.assertRaises(RuntimeError):
+                    reset_limits()
+            finally:
+                del os.environ[name]
+        reset_limits()
+
+    def test_write_limits_disabled(self):
+        """Test that a zero rate and concurrency disable the write limits."""
+        os.environ['WRITE_RATE_LIMIT'] = '0'
+        os.environ['WRITE_CONCURRENCY'] = ''
+        reset_limits()
+        try:
+            for _ in range(30):
+                response = self.app.post('/warehouse/new', data={
+                    'name': 'Unlimited', 'capacity': '1'})
+                self.assertEqual(response.status_code, 302)
+
+            response = self.app.get('/limits')
+            self.assertIsNone(response.json['rate_limit'])
+            self.assertIsNone(response.json['admission'])
+        finally:
+            del os.environ['WRITE_RATE_LIMIT']
+            del os.environ['WRITE_CONCURRENCY']
+            reset_limits()
+
     def test_list_warehouses(self):
         """Test listing all warehouses."""
         # Create multiple warehouses
@@ -0,0 +1,119 @@
+import unittest
+import threading
+from ratelimit import RateLimiter, AdmissionQueue
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.limiter = RateLimiter(rate=2, burst=3, clock=self.clock)
+
+    def test_purske_sallitaan(self):
+        for _ in range(3):
+            self.assertEqual(self.limiter.check('a'), 0.0)
+
+    def test_purskeen_jalkeen_rajoitetaan(self):
+        for _ in range(3):
+            self.limiter.check('a')
+
+        self.assertAlmostEqual(self.limiter.check('a'), 0.5)
+
+    def test_tokenit_palautuvat(self):
+        for _ in range(3):
+            self.limiter.check('a')
+        self.clock.now = 0.5
+
+        self.assertEqual(self.limiter.check('a'), 0.0)
+        self.assertGreater(self.limiter.check('a'), 0.0)
+
+    def test_avaimet_erillisia(self):
+        for _ in range(3):
+            self.limiter.check('a')
+
+        self.assertEqual(self.limiter.check('b'), 0.0)
+
+    def test_laskurit(self):
+        for _ in range(5):
+            self.limiter.check('a')
+
+        stats = self.limiter.stats()
+        self.assertEqual(stats['allowed'], 3)
+        self.assertEqual(stats['limited'], 2)
+        self.assertEqual(stats['clients'], 1)
+
+    def test_sankojen_maara_rajattu(self):
+        limiter = RateLimiter(rate=1, burst=1, max_buckets=2, clock=self.clock)
+        for key in range(10):
+            limiter.check(key)
+
+        self.assertEqual(limiter.stats()['clients'], 2)
+
+    def test_vanhin_sanko_unohdetaan_ensin(self):
+        limiter = RateLimiter(rate=1, burst=1, max_buckets=2, clock=self.clock)
+        limiter.check('a')
+        limiter.check('b')
+        limiter.check('a')
+        limiter.check('c')
+
+        # 'a' was used more recently than 'b', so it is still limited
+        self.assertGreater(limiter.check('a'), 0.0)
+        self.assertEqual(limiter.check('b'), 0.0)
+
+    def test_virheellinen_nopeus(self):
+        with self.assertRaises(ValueError):
+            RateLimiter(rate=0, burst=1)
+        with self.assertRaises(ValueError):
+            RateLimiter(rate=float('nan'), burst=1)
+
+
+class TestAdmissionQueue(unittest.TestCase):
+    def test_paastetaan_rajaan_asti(self):
+        queue = AdmissionQueue(max_concurrent=2, max_waiting=0, timeout=0)
+
+        self.assertTrue(queue.acquire())
+        self.assertTrue(queue.acquire())
+        self.assertFalse(queue.acquire())
+        self.assertEqual(queue.stats()['rejected'], 1)
+
+    def test_vapautus_avaa_paikan(self):
+        queue = AdmissionQueue(max_concurrent=1, max_waiting=0, timeout=0)
+        queue.acquire()
+        queue.release()
+
+        self.assertTrue(queue.acquire())
+        self.assertEqual(queue.stats()['admitted'], 2)
+
+    def test_jonossa_odotus_aikakatkaistaan(self):
+        queue = AdmissionQueue(max_concurrent=1, max_waiting=1, timeout=0.01)
+        queue.acquire()
+
+        self.assertFalse(queue.acquire())
+        self.assertEqual(queue.stats()['timed_out'], 1)
+        self.assertEqual(queue.stats()['waiting'], 0)
+
+    def test_jonosta_paastaan_kun_paikka_vapautuu(self):
+        queue = AdmissionQueue(max_concurrent=1, max_waiting=1, timeout=5)
+        queue.acquire()
+        timer = threading.Timer(0.01, queue.release)
+        timer.start()
+
+        self.assertTrue(queue.acquire())
+        timer.join()
+        self.assertEqual(queue.stats()['running'], 1)
+
+    def test_retry_after_vahintaan_sekunti(self):
+        queue = AdmissionQueue(max_concurrent=1, max_waiting=0, timeout=0.2)
+
+        self.assertEqual(queue.retry_after(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import unittest
+import os
+import struct
+import tempfile
+from models import Base, Warehouse, Item
+from snapshot import export_snapshot, load_snapshot, SnapshotError
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        self.session.close()
+        os.unlink(self.path)
+
+    def lisaa_varastot(self):
+        mehua = Warehouse(name='Mehua', capacity=100.0)
+        olutta = Warehouse(name='Olutta ÄÖ', capacity=50.0)
+        self.session.add_all([mehua, olutta])
+        self.session.commit()
+        self.session.add_all([
+            Item(name='Appelsiini', quantity=10.0, warehouse_id=mehua.id),
+            Item(name='Omena', quantity=20.5, warehouse_id=mehua.id),
+            Item(name='Lager', quantity=70.0, warehouse_id=olutta.id),
+        ])
+        self.session.commit()
+        return mehua.id, olutta.id
+
+    def test_export_palauttaa_rivimaarat(self):
+        self.lisaa_varastot()
+        self.assertEqual(export_snapshot(self.session, self.path), (2, 3))
+
+    def test_sarakkeet_sailyvat(self):
+        mehua_id, olutta_id = self.lisaa_varastot()
+        export_snapshot(self.session, self.path)
+
+        with load_snapshot(self.path) as snapshot:
+            self.assertEqual(list(snapshot.warehouses['id']),
+                             [mehua_id, olutta_id])
+            self.assertEqual(list(snapshot.warehouses['capacity']),
+                             [100.0, 50.0])
+            self.assertEqual(list(snapshot.items['warehouse_id']),
+                             [mehua_id, mehua_id, olutta_id])
+            self.assertEqual(list(snapshot.items['quantity']),
+                             [10.0, 20.5, 70.0])
+            self.assertEqual(len(snapshot.items), 3)
+
+    def test_nimet_sailyvat(self):
+        self.lisaa_varastot()
+        export_snapshot(self.session, self.path)
+
+        with load_snapshot(self.path) as snapshot:
+            self.assertEqual(snapshot.warehouses.name(1), 'Olutta ÄÖ')
+            self.assertEqual(snapshot.items.name(0), 'Appelsiini')
+            self.assertEqual(snapshot.items.name(2), 'Lager')
+
+    def test_varastot(self):
+        mehua_id, olutta_id = self.lisaa_varastot()
+        export_snapshot(self.session, self.path)
+
+        with load_snapshot(self.path) as snapshot:
+            varastot = snapshot.varastot()
+
+        self.assertAlmostEqual(varastot[mehua_id].saldo, 30.5)
+        self.assertAlmostEqual(varastot[mehua_id].paljonko_mahtuu(), 69.5)
+        # ylimäärä hukkaan, kuten Varastossa
+        self.assertAlmostEqual(varastot[olutta_id].saldo, 50.0)
+
+    def test_tyhja_tietokanta(self):
+        export_snapshot(self.session, self.path)
+
+        with load_snapshot(self.path) as snapshot:
+            self.assertEqual(len(snapshot.warehouses), 0)
+            self.assertEqual(snapshot.varastot(), {})
+
+    def test_orpo_tuote_ei_kelpaa(self):
+        # SQLite does not enforce the foreign key
+        self.session.add(Item(name='Orpo', quantity=1.0, warehouse_id=999))
+        self.session.commit()
+
+        with self.assertRaises(SnapshotError):
+            export_snapshot(self.session, self.path)
+        self.assertEqual(os.path.getsize(self.path), 0)
+
+    def test_orpo_tuote_tiedostossa(self):
+        self.lisaa_varastot()
+        export_snapshot(self.session, self.path)
+        # point the first item at a warehouse that does not exist
+        with open(self.path, 'r+b') as snapshot_file:
+            snapshot_file.seek(24 + 8 * (2 + 2 + 3) + 8 * 3)
+            snapshot_file.write(struct.pack('<q', 999))
+
+        with load_snapshot(self.path) as snapshot:
+            with self.assertRaises(SnapshotError):
+                snapshot.varastot()
+
+    def test_virheellinen_nimi(self):
+        self.lisaa_varastot()
+        export_snapshot(self.session, self.path)
+        with open(self.path, 'r+b') as snapshot_file:
+            snapshot_file.seek(-1, os.SEEK_END)
+            snapshot_file.write(b'\xff')
+
+        with load_snapshot(self.path) as snapshot:
+            with self.assertRaises(SnapshotError):
+                snapshot.items.name(2)
+
+    def test_sulkeminen_kun_viipale_kaytossa(self):
+        self.lisaa_varastot()
+        export_snapshot(self.session, self.path)
+        snapshot = load_snapshot(self.path)
+        viipale = snapshot.items['quantity'][0:1]
+
+        with self.assertRaises(SnapshotError):
+            snapshot.close()
+
+        viipale.release()
+        snapshot.close()
+
+    def test_virheellinen_tiedosto(self):
+        with open(self.path, 'wb') as snapshot_file:
+            snapshot_file.write(b'not a snapshot at all, really')
+
+        with self.assertRaises(SnapshotError):
+            load_snapshot(self.path)
+
+    def test_tyhja_tiedosto(self):
+        with self.assertRaises(SnapshotError):
+            load_snapshot(self.path)
+
+    def test_katkaistu_tiedosto(self):
+        self.lisaa_varastot()
+        export_snapshot(self.session, self.path)
+        with open(self.path, 'r+b') as snapshot_file:
+            snapshot_file.truncate(40)
+
+        with self.assertRaises(SnapshotError):
+            load_snapshot(self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+import os
+import tempfile
+from varasto import Varasto
+from stress import (stress_varasto, stress_database, ReferenceVarasto,
+                    StressConfig)
+
+
+class RikkinainenVarasto(Varasto):
+    def ota_varastosta(self, maara):
+        # ei tarkista saldoa
+        self.saldo = self.saldo - abs(maara)
+        return abs(maara)
+
+
+class TestStress(unittest.TestCase):
+    def test_viitevarasto(self):
+        viite = ReferenceVarasto(10.0, 4.0)
+
+        self.assertAlmostEqual(viite.lisaa(8.0), 6.0)
+        self.assertAlmostEqual(viite.ota(-1.0), 0.0)
+        self.assertAlmostEqual(viite.ota(12.0), 10.0)
+        self.assertAlmostEqual(viite.saldo, 0.0)
+
+    def test_varasto_sailyttaa_saldot(self):
+        tulos = stress_varasto(operations=4000, threads=4, seed=1)
+
+        self.assertEqual(tulos.violations, [])
+        self.assertEqual(tulos.operations, 4000)
+        self.assertGreater(tulos.throughput, 0)
+
+    def test_rikkinainen_varasto_havaitaan(self):
+        tulos = stress_varasto(operations=1000, threads=2, seed=1,
+                               varasto_class=RikkinainenVarasto)
+
+        self.assertNotEqual(tulos.violations, [])
+
+    def aja_tietokanta(self, path):
+        fd, db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        try:
+            return stress_database(f'sqlite:///{db_path}', path,
+                                   StressConfig(operations=200, seed=1))
+        finally:
+            os.unlink(db_path)
+
+    def test_tuntematon_asetus(self):
+        with self.assertRaises(TypeError):
+            StressConfig(operation=200)
+
+    def test_siirtoreitti_sailyttaa_saldot(self):
+        tulos = self.aja_tietokanta('route')
+
+        self.assertEqual(tulos.violations, [])
+        self.assertEqual(tulos.operations + tulos.rejected, 200)
+        self.assertGreater(tulos.operations, 0)
+        self.assertIn('transfer route', str(tulos))
+
+    def test_transfer_items_sailyttaa_saldot(self):
+        tulos = self.aja_tietokanta('api')
+
+        self.assertEqual(tulos.violations, [])
+        self.assertEqual(tulos.operations + tulos.rejected, 200)
+        self.assertGreater(tulos.operations, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
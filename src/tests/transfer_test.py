@@ -0,0 +1,207 @@
+import unittest
+import os
+import tempfile
+from models import Base, Warehouse, Item
+import transfer
+from transfer import transfer_items, TransferError
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import sessionmaker
+
+
+class TestTransfer(unittest.TestCase):
+    def setUp(self):
+        # a file database, so that separate sessions see each other
+        fd, self.db_path = tempfile.mkstemp()
+        os.close(fd)
+        self.engine = create_engine(f'sqlite:///{self.db_path}')
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.session = self.Session()
+
+        self.mehua = Warehouse(name='Mehua', capacity=100.0)
+        self.olutta = Warehouse(name='Olutta', capacity=50.0)
+        self.session.add_all([self.mehua, self.olutta])
+        self.session.commit()
+        self.omena = Item(name='Omena', quantity=30.0,
+                          warehouse_id=self.mehua.id)
+        self.appelsiini = Item(name='Appelsiini', quantity=20.0,
+                               warehouse_id=self.mehua.id)
+        self.lager = Item(name='Lager', quantity=40.0,
+                          warehouse_id=self.olutta.id)
+        self.session.add_all([self.omena, self.appelsiini, self.lager])
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+        os.unlink(self.db_path)
+
+    def maara(self, warehouse, name):
+        item = self.session.query(Item).filter_by(
+            warehouse_id=warehouse.id, name=name).first()
+        return item.quantity if item else None
+
+    def test_siirto_luo_tuotteen_kohteeseen(self):
+        transfer_items(self.session, [(self.omena.id, self.olutta.id, 5)])
+
+        self.assertAlmostEqual(self.maara(self.mehua, 'Omena'), 25.0)
+        self.assertAlmostEqual(self.maara(self.olutta, 'Omena'), 5.0)
+
+    def test_siirto_yhdistaa_samannimiseen_tuotteeseen(self):
+        transfer_items(self.session, [(self.lager.id, self.mehua.id, 10)])
+        transfer_items(self.session, [(self.lager.id, self.mehua.id, 10)])
+
+        self.assertAlmostEqual(self.maara(self.mehua, 'Lager'), 20.0)
+        self.assertEqual(self.session.query(Item)
+                         .filter_by(name='Lager').count(), 2)
+
+    def test_usean_tuotteen_siirto(self):
+        transfer_items(self.session, [(self.omena.id, self.olutta.id, 5),
+                                      (self.appelsiini.id, self.olutta.id, 3),
+                                      (self.lager.id, self.mehua.id, 40)])
+
+        self.assertAlmostEqual(self.maara(self.olutta, 'Omena'), 5.0)
+        self.assertAlmostEqual(self.maara(self.olutta, 'Appelsiini'), 3.0)
+        self.assertAlmostEqual(self.maara(self.olutta, 'Lager'), 0.0)
+        self.assertAlmostEqual(self.maara(self.mehua, 'Lager'), 40.0)
+
+    def test_vapautunut_tila_kaytettavissa_samassa_siirrossa(self):
+        # olutta has 10 free, the first move frees 40 more
+        transfer_items(self.session, [(self.lager.id, self.mehua.id, 40),
+                                      (self.omena.id, self.olutta.id, 30)])
+
+        self.assertAlmostEqual(self.maara(self.olutta, 'Omena'), 30.0)
+
+    def test_tila_ei_riita(self):
+        with self.assertRaises(TransferError):
+            transfer_items(self.session, [(self.omena.id, self.olutta.id, 11)])
+
+        self.assertAlmostEqual(self.maara(self.mehua, 'Omena'), 30.0)
+        self.assertIsNone(self.maara(self.olutta, 'Omena'))
+
+    def test_saldo_ei_riita(self):
+        with self.assertRaises(TransferError):
+            transfer_items(self.session, [(self.lager.id, self.mehua.id, 41)])
+
+        self.assertAlmostEqual(self.maara(self.olutta, 'Lager'), 40.0)
+
+    def test_epaonnistunut_siirto_perutaan_kokonaan(self):
+        with self.assertRaises(TransferError):
+            transfer_items(self.session, [(self.omena.id, self.olutta.id, 5),
+                                          (self.appelsiini.id, self.olutta.id,
+                                           6)])
+
+        self.assertAlmostEqual(self.maara(self.mehua, 'Omena'), 30.0)
+        self.assertIsNone(self.maara(self.olutta, 'Omena'))
+
+    def test_negatiivinen_maara(self):
+        with self.assertRaises(TransferError):
+            transfer_items(self.session, [(self.omena.id, self.olutta.id, -1)])
+
+    def test_tyhja_siirto(self):
+        with self.assertRaises(TransferError):
+            transfer_items(self.session, [])
+
+    def test_tuntematon_tuote(self):
+        with self.assertRaises(TransferError):
+            transfer_items(self.session, [(9999, self.olutta.id, 1)])
+
+    def test_tuntematon_varasto(self):
+        with self.assertRaises(TransferError):
+            transfer_items(self.session, [(self.omena.id, 9999, 1)])
+
+        self.assertAlmostEqual(self.maara(self.mehua, 'Omena'), 30.0)
+
+    def test_siirto_samaan_varastoon(self):
+        with self.assertRaises(TransferError):
+            transfer_items(self.session, [(self.omena.id, self.mehua.id, 1)])
+
+    def test_ylitaysi_varasto_ei_ota_vastaan(self):
+        ylitaysi = Warehouse(name='Ylitäysi', capacity=10.0)
+        self.session.add(ylitaysi)
+        self.session.commit()
+        x = Item(name='X', quantity=30.0, warehouse_id=ylitaysi.id)
+        y = Item(name='Y', quantity=5.0, warehouse_id=self.mehua.id)
+        self.session.add_all([x, y])
+        self.session.commit()
+
+        with self.assertRaises(TransferError):
+            transfer_items(self.session, [(x.id, self.mehua.id, 5),
+                                          (y.id, ylitaysi.id, 5)])
+
+        self.assertAlmostEqual(self.maara(ylitaysi, 'X'), 30.0)
+        self.assertIsNone(self.maara(ylitaysi, 'Y'))
+
+    def test_virheellinen_syote(self):
+        for moves in [[('abc', self.olutta.id, 1)],
+                      [(self.omena.id, None, 1)],
+                      [(self.omena.id, self.olutta.id)],
+                      [None]]:
+            with self.assertRaises(TransferError):
+                transfer_items(self.session, moves)
+
+    def test_ennen_lukitusta_ladatut_tuotteet_luetaan_uudelleen(self):
+        # as in the route, the items are loaded before transfer_items()
+        toinen = self.Session()
+        lahde = toinen.query(Warehouse).filter_by(id=self.mehua.id).first()
+        self.assertEqual(len(lahde.items), 2)
+
+        transfer_items(self.session, [(self.omena.id, self.olutta.id, 4)])
+        transfer_items(toinen, [(self.omena.id, self.olutta.id, 4)])
+        toinen.close()
+
+        self.session.expire_all()
+        self.assertAlmostEqual(self.maara(self.mehua, 'Omena'), 22.0)
+        self.assertAlmostEqual(self.maara(self.olutta, 'Omena'), 8.0)
+
+    def test_ennen_lukitusta_poistettu_tuote(self):
+        # the item is deleted after its warehouse was looked up but
+        # before the lock
+        toinen = self.Session()
+        alkuperainen = transfer.lock_warehouses
+
+        def poista_ensin(session, warehouse_ids):
+            toinen.query(Item).filter_by(id=self.omena.id).delete()
+            toinen.commit()
+            return alkuperainen(session, warehouse_ids)
+
+        transfer.lock_warehouses = poista_ensin
+        try:
+            with self.assertRaises(TransferError):
+                transfer_items(self.session,
+                               [(self.omena.id, self.olutta.id, 4)])
+        finally:
+            transfer.lock_warehouses = alkuperainen
+            toinen.close()
+
+        self.assertIsNone(self.maara(self.olutta, 'Omena'))
+
+    def aseta_null(self, item):
+        # the column default would replace quantity=None with 0.0
+        self.session.execute(update(Item).where(Item.id == item.id)
+                             .values(quantity=None))
+        self.session.commit()
+
+    def test_tuotteella_ei_maaraa(self):
+        tyhja = Item(name='Tyhjä', warehouse_id=self.mehua.id)
+        self.session.add(tyhja)
+        self.session.commit()
+        self.aseta_null(tyhja)
+
+        with self.assertRaises(TransferError):
+            transfer_items(self.session, [(tyhja.id, self.olutta.id, 1)])
+
+    def test_kohteen_tuotteella_ei_maaraa(self):
+        kohde = Item(name='Omena', warehouse_id=self.olutta.id)
+        self.session.add(kohde)
+        self.session.commit()
+        self.aseta_null(kohde)
+
+        with self.assertRaises(TransferError):
+            transfer_items(self.session, [(self.omena.id, self.olutta.id, 1)])
+
+        self.assertAlmostEqual(self.maara(self.mehua, 'Omena'), 30.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
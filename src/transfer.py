@@ -0,0 +1,177 @@
+# Stock transfers between warehouses
+from sqlalchemy import func, update
+from models import Warehouse, Item
+from varasto import Varasto
+
+
+class TransferError(Exception):
+    pass
+
+
+def lock_warehouses(session, warehouse_ids):
+    """Lock the given warehouses for the rest of the transaction.
+
+    SELECT ... FOR UPDATE is a no-op on SQLite, so the rows are touched
+    with a no-op UPDATE instead. That takes row locks on databases that
+    have them and the database write lock on SQLite. Locks are always
+    taken in id order so that concurrent transfers cannot deadlock.
+    """
+    for warehouse_id in sorted(warehouse_ids):
+        session.execute(update(Warehouse)
+                        .where(Warehouse.id == warehouse_id)
+                        .values(capacity=Warehouse.capacity))
+    # objects the session loaded before the lock may be stale, so refresh
+    # them from the database
+    warehouses = (session.query(Warehouse)
+                  .filter(Warehouse.id.in_(sorted(warehouse_ids)))
+                  .order_by(Warehouse.id).populate_existing().all())
+    return {warehouse.id: warehouse for warehouse in warehouses}
+
+
+def load_totals(session, warehouse_ids):
+    """Total item quantity of each warehouse.
+
+    These are raw sums: add_item() and edit_item() do not check capacity,
+    so a total may exceed the capacity of its warehouse.
+    """
+    totals = dict(session.query(Item.warehouse_id, func.sum(Item.quantity))
+                  .filter(Item.warehouse_id.in_(sorted(warehouse_ids)))
+                  .group_by(Item.warehouse_id).all())
+    return {warehouse_id: totals.get(warehouse_id) or 0.0
+            for warehouse_id in warehouse_ids}
+
+
+def _parse_move(move):
+    try:
+        item_id, destination_id, quantity = move
+        return int(item_id), int(destination_id), float(quantity)
+    except (TypeError, ValueError) as error:
+        raise TransferError(f"Invalid transfer {move!r}") from error
+
+
+def _parse_moves(moves):
+    parsed = []
+    for move in moves:
+        item_id, destination_id, quantity = _parse_move(move)
+        # not quantity <= 0, which would let NaN through
+        if not quantity > 0:  # pylint: disable=unnecessary-negation
+            raise TransferError("Transfer quantities must be positive")
+        parsed.append((item_id, destination_id, quantity))
+    if not parsed:
+        raise TransferError("Nothing to transfer")
+    return parsed
+
+
+def _check_found(wanted, found, kind):
+    missing = set(wanted) - set(found)
+    if missing:
+        raise TransferError(f"{kind} {min(missing)} not found")
+
+
+def _source_warehouses(session, item_ids):
+    # read before locking, only to know which warehouses to lock
+    sources = dict(session.query(Item.id, Item.warehouse_id)
+                   .filter(Item.id.in_(sorted(item_ids))).all())
+    _check_found(item_ids, sources.keys(), "Item")
+    return set(sources.values())
+
+
+def _lock_involved(session, moves):
+    item_ids = {item_id for item_id, _, _ in moves}
+    warehouse_ids = _source_warehouses(session, item_ids)
+    warehouse_ids.update(destination for _, destination, _ in moves)
+    warehouses = lock_warehouses(session, warehouse_ids)
+    _check_found(warehouse_ids, warehouses.keys(), "Warehouse")
+    items = (session.query(Item)
+             .filter(Item.warehouse_id.in_(sorted(warehouse_ids)))
+             .order_by(Item.id).populate_existing().all())
+    # an item may have been deleted before the lock was taken
+    _check_found(item_ids, (item.id for item in items), "Item")
+    return warehouses, items
+
+
+class _Stock:
+    """The locked items and warehouses of one transfer."""
+
+    def __init__(self, warehouses, items, totals):
+        self.by_id = {item.id: item for item in items}
+        self.by_name = {}
+        for item in items:
+            self.by_name.setdefault((item.warehouse_id, item.name), item)
+        self.capacities = {warehouse_id: warehouse.capacity or 0.0
+                           for warehouse_id, warehouse in warehouses.items()}
+        self.totals = totals
+
+    def free_space(self, warehouse_id):
+        # not Varasto.paljonko_mahtuu(): Varasto would cap an overfull
+        # warehouse at its capacity and hide the overflow
+        return self.capacities[warehouse_id] - self.totals[warehouse_id]
+
+    def reserve(self, item, destination_id, amount):
+        """Move amount of item from its warehouse's total to the
+        destination's, if it fits there."""
+        if self.free_space(destination_id) < amount:
+            raise TransferError(f'Not enough space for "{item.name}" in '
+                                f'warehouse {destination_id}')
+        self.totals[item.warehouse_id] -= amount
+        self.totals[destination_id] += amount
+
+
+def _quantity(item):
+    # Item.quantity is nullable
+    if item.quantity is None:
+        raise TransferError(f'Item "{item.name}" has no quantity')
+    return item.quantity
+
+
+def _take(item, destination_id, quantity):
+    if item.warehouse_id == destination_id:
+        raise TransferError(f'Item "{item.name}" is already in warehouse '
+                            f'{destination_id}')
+    # an item is a full Varasto of its own quantity
+    saldo = _quantity(item)
+    taken = Varasto(saldo, saldo).ota_varastosta(quantity)
+    if taken < quantity:
+        raise TransferError(f'Not enough "{item.name}" in stock')
+    return taken
+
+
+def _destination_item(session, stock, source, destination_id):
+    target = stock.by_name.get((destination_id, source.name))
+    if target is None:
+        target = Item(name=source.name, quantity=0.0,
+                      warehouse_id=destination_id)
+        session.add(target)
+        stock.by_name[destination_id, source.name] = target
+    return target
+
+
+def _move(session, stock, move):
+    item_id, destination_id, quantity = move
+    item = stock.by_id[item_id]
+    taken = _take(item, destination_id, quantity)
+    stock.reserve(item, destination_id, taken)
+    item.quantity = item.quantity - taken
+    target = _destination_item(session, stock, item, destination_id)
+    target.quantity = _quantity(target) + taken
+
+
+def transfer_items(session, moves):
+    """Move stock between warehouses in a single transaction.
+
+    moves is an iterable of (item_id, destination_warehouse_id, quantity).
+    Stock is merged into the destination item with the same name, or a new
+    item is created there. Either every move is committed or, on
+    TransferError, none is.
+    """
+    try:
+        moves = _parse_moves(moves)
+        warehouses, items = _lock_involved(session, moves)
+        stock = _Stock(warehouses, items,
+                       load_totals(session, warehouses.keys()))
+        for move in moves:
+            _move(session, stock, move)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise